@@ -13,9 +13,33 @@ Each appended exchange replicates the same amount and unit as the original techn
 import os
 from datetime import datetime
 import bw2data as bd
-import pandas as pd
+from ExplodeDatabase import read_csv
+from peewee import OperationalError
 from tqdm import tqdm
 
+# The sqlite database with the activities and exchanges, which moved in bw2data 4
+try:
+    from bw2data.backends import sqlite3_lci_db
+except ImportError:
+    from bw2data.backends.peewee import sqlite3_lci_db
+
+# Number of new exchanges that are saved in one transaction, the database
+# is locked for the other workers while a transaction is open
+EDIT_BATCH_SIZE = 1000
+
+
+def write_transaction():
+    """
+    A transaction that takes the write lock of the sqlite database when it starts.
+
+    The pool workers edit the same sqlite file. A deferred transaction that reads before it writes
+    can fail with SQLITE_BUSY when another worker writes in between, and sqlite does not retry that.
+    An immediate transaction waits for the lock (for the busy timeout) before it starts instead.
+
+    :returns: The transaction, as a context manager.
+    """
+    return sqlite3_lci_db.db.atomic(lock_type="IMMEDIATE")
+
 
 def ExchangeEditor(project_T_reX, db_name, db_T_reX_name):
     """
@@ -31,6 +55,7 @@ def ExchangeEditor(project_T_reX, db_name, db_T_reX_name):
     :rtype: None
 
     :raises Exception: If any specified process or exchange is not found in the database.
+    :raises OperationalError: If the sqlite database can not be read or written, e.g. when it stays locked by another worker.
     """
 
     # Import user settings and directory paths
@@ -70,7 +95,7 @@ def ExchangeEditor(project_T_reX, db_name, db_T_reX_name):
 
     # Create a DataFrame for each file and store it in the dictionary
     for key, f_path in file_dict.items():
-        df = pd.read_csv(f_path, sep=";", header=0, index_col=0)
+        df = read_csv(f_path)
         df.reset_index(inplace=True)
         df = df[
             [
@@ -102,66 +127,88 @@ def ExchangeEditor(project_T_reX, db_name, db_T_reX_name):
     bar_format = f"{{desc:<{max_progress_length + max_name_length + 10}}} | {{bar:30}} | {{percentage:3.1f}}% | Progress: {{n:>5}} of {{total:<5}} | Elapsed: {{elapsed:<5}} | Remaining: {{remaining:<5}}"
 
     start = datetime.now()
+    # The log entries are written to the log file in one go, after the last category
+    log_entries = []
+    # The processes are looked up once, a process can get exchanges for many categories
+    processes = {}
     # Iterate over each category (NAME)
     for NAME, df in sorted(file_dict.items(), reverse=False):
         countNAME += 1
         progress_db = f"{countNAME:2}/{len(file_dict.items())}"
         count = 0
 
+        T_reX_KEY = (
+            db_T_reX_name,
+            NAME.split("_")[1]
+            .capitalize()
+            .replace("_", " ")
+            .replace("-", " ")
+            .replace("kilogram", "(kg)")
+            .replace("cubicmeter", "(m3)"),
+        )
+        T_reX_ex = None
+
         # For each exchange in the current category's DataFrame
-        for exc in tqdm(
-            df.to_dict("records"),
+        records = df.to_dict("records")
+        progress = tqdm(
+            total=len(records),
             desc=f" - {progress_db} : {NAME} ",
             bar_format=bar_format,
             colour="magenta",
             smoothing=0.01,
-        ):
-            # Extract details of the exchange
-            code, name, location, ex_name, amount, unit, ex_location, database = (
-                exc["code"],
-                exc["name"],
-                exc["location"],
-                exc["ex_name"],
-                exc["ex_amount"],
-                exc["ex_unit"],
-                exc["ex_location"],
-                db_name,
-            )
-
-            KEY = (database, code)
-            T_reX_KEY = (
-                db_T_reX_name,
-                NAME.split("_")[1]
-                .capitalize()
-                .replace("_", " ")
-                .replace("-", " ")
-                .replace("kilogram", "(kg)")
-                .replace("cubicmeter", "(m3)"),
-            )
-            # Retrieve the process and T_reX exchange from the databases
-            try:
-                process = bd.get_activity(KEY)
-                T_reX_ex = bd.get_activity(T_reX_KEY)
-                before = len(process.exchanges())
-
-                #! TODO: Check if the exchange already exists in the process, and if so, skip it
-                # Create a new exchange in the process
-                process.new_exchange(
-                    input=T_reX_ex,
-                    amount=amount,
-                    unit=unit,
-                    type="biosphere",
-                ).save()
-                after = len(process.exchanges())
-
-                # If the exchange was successfully added, increment the counter
-                if (after - before) == 1:
-                    count += 1
-
-            except Exception as e:
-                print(e)
-                print(f"Process {name}, {ex_location} not found in {db_name}")
-                continue
+        )
+        # The new exchanges are saved in batches, with one commit per batch instead of per exchange
+        for batch_start in range(0, len(records), EDIT_BATCH_SIZE):
+            # The processes are looked up before the transaction, so it only writes
+            batch = []
+            for exc in records[batch_start : batch_start + EDIT_BATCH_SIZE]:
+                progress.update()
+                # Extract details of the exchange
+                code, name, amount, unit, ex_location, database = (
+                    exc["code"],
+                    exc["name"],
+                    exc["ex_amount"],
+                    exc["ex_unit"],
+                    exc["ex_location"],
+                    db_name,
+                )
+
+                KEY = (database, code)
+                # Retrieve the process and T_reX exchange from the databases
+                try:
+                    if KEY not in processes:
+                        processes[KEY] = bd.get_activity(KEY)
+                    if T_reX_ex is None:
+                        T_reX_ex = bd.get_activity(T_reX_KEY)
+                # an error of the sqlite database is not a missing process
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    print(e)
+                    print(f"Process {name}, {ex_location} not found in {db_name}")
+                    continue
+                batch.append((processes[KEY], amount, unit, name, ex_location))
+
+            with write_transaction():
+                for process, amount, unit, name, ex_location in batch:
+                    #! TODO: Check if the exchange already exists in the process, and if so, skip it
+                    # Create a new exchange in the process, save() raises an error if it was not added
+                    try:
+                        process.new_exchange(
+                            input=T_reX_ex,
+                            amount=amount,
+                            unit=unit,
+                            type="biosphere",
+                        ).save()
+                        count += 1
+                    except OperationalError:
+                        raise
+                    except Exception as e:
+                        print(e)
+                        print(
+                            f"Exchange for process {name}, {ex_location} not added in {db_name}"
+                        )
+        progress.close()
 
         # Log the time taken and the number of additions for this category
         end = datetime.now()
@@ -176,11 +223,13 @@ def ExchangeEditor(project_T_reX, db_name, db_T_reX_name):
             "duration:",
             str(duration),
         )
-        log_file = os.path.join(
-            dir_logs, f'{datetime.now().strftime("%Y-%m-%d")}_ExchangeEditor.txt'
-        )
-        with open(log_file, "a") as l:
-            l.write(str(log_entry) + "\n")
+        log_entries.append(str(log_entry) + "\n")
+
+    log_file = os.path.join(
+        dir_logs, f'{datetime.now().strftime("%Y-%m-%d")}_ExchangeEditor.txt'
+    )
+    with open(log_file, "a") as l:
+        l.writelines(log_entries)
     print(f'{"*"*100}')
     print(
         f"\n*** ExchangeEditor() completed for {db_name} in {str(duration).split('.')[0]} (h:m:s) ***\n"
@@ -4,18 +4,175 @@ ExplodeDatabase Module
 
 This module is responsible for exploding a Brightway2 database into a single-level list of all exchanges.
 It utilizes the wurst package to unpack the database, explode it to a list of all exchanges, and save this data 
-in a DataFrame as a .pickle binary file.
+in a DataFrame as a .parquet file (or a .pickle binary file if pyarrow is not installed).
+
+The helper functions :func:`exploded_path` and :func:`load_exploded` are used by the search modules to find and read
+the saved data, and :func:`write_csv` to write their results, which are read back with :func:`read_csv`.
 
 """
 
 # Imports
+import operator
 import os
 from datetime import datetime
 
 import bw2data as bd
+import numpy as np
 import pandas as pd
 import wurst as w
 
+EXPLODED_SUFFIXES = ["_exploded.parquet", "_exploded.pickle"]
+
+
+def exploded_path(db_name):
+    """
+    Find the saved exploded database, preferring the .parquet over the .pickle file.
+
+    :param str db_name: Name of the Brightway2 database.
+    :returns: Path to the file, or None if the database has not been exploded yet.
+    """
+    from config.user_settings import dir_tmp
+
+    for suffix in EXPLODED_SUFFIXES:
+        path = dir_tmp / f"{db_name}{suffix}"
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# The last exploded database that was loaded in full, {(path, modification time): DataFrame}
+exploded_cache = {}
+
+FILTER_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def restore_nested(df):
+    """
+    Turn the nested values of a DataFrame loaded from parquet back into tuples.
+
+    Parquet stores tuples and lists as arrays, so they are loaded as numpy arrays. The categories
+    are restored as tuples and the classifications as lists of (system, code) tuples, as they are
+    in the Brightway2 database, so a parquet and a pickle file give the same results and CSV text.
+    The values belong to the activity, so they are restored once per activity code.
+
+    :param pd.DataFrame df: The data loaded from parquet, changed in place.
+    :returns: pd.DataFrame with the restored columns.
+    """
+    restore = {
+        "categories": lambda value: tuple(value),
+        "classifications": lambda value: [tuple(item) for item in value],
+    }
+    columns = [column for column in restore if column in df.columns]
+    if not columns or df.empty:
+        return df
+
+    codes, _ = pd.factorize(df.index, use_na_sentinel=False)
+    _, first_rows = np.unique(codes, return_index=True)
+    for column in columns:
+        values = df[column].to_numpy()
+        restored = np.empty(len(first_rows), dtype=object)
+        restored[:] = [
+            restore[column](value) if isinstance(value, np.ndarray) else value
+            for value in values[first_rows]
+        ]
+        df[column] = restored[codes]
+    return df
+
+
+def load_exploded(db_name, columns=None, filters=None):
+    """
+    Load the exploded database saved by :func:`ExplodeDatabase` into a DataFrame.
+
+    Parquet files are memory-mapped, only the requested columns are read and the filters
+    are applied while reading, so rows that are filtered out are never loaded. Nested values
+    are restored with :func:`restore_nested`.
+
+    The last database that was loaded in full (or pickled by :func:`ExplodeDatabase`) is kept in memory,
+    so SearchMaterial can reuse the data that SearchWaste loaded. It is loaded again if the file has changed.
+
+    :param str db_name: Name of the Brightway2 database.
+    :param list columns: Columns to load (all columns if None).
+    :param list filters: Row filters as (column, op, value) tuples, e.g. ("ex_type", "==", "technosphere"),
+        with op one of ==, !=, <, <=, >, >=. All filters must be true for a row to be loaded.
+    :returns: pd.DataFrame indexed by activity code, or None if the file does not exist.
+    """
+    path = exploded_path(db_name)
+    if path is None:
+        return None
+    key = (str(path), os.path.getmtime(path))
+
+    if key in exploded_cache:
+        df = exploded_cache[key]
+    elif path.suffix == ".parquet" and (columns or filters):
+        return restore_nested(
+            pd.read_parquet(
+                path, engine="pyarrow", columns=columns, filters=filters, memory_map=True
+            )
+        )
+    else:
+        if path.suffix == ".parquet":
+            df = restore_nested(pd.read_parquet(path, engine="pyarrow", memory_map=True))
+        else:
+            df = pd.read_pickle(path)
+        exploded_cache.clear()
+        exploded_cache[key] = df
+
+    if filters:
+        mask = np.ones(len(df), dtype=bool)
+        for column, op, value in filters:
+            mask &= FILTER_OPS[op](df[column], value).to_numpy()
+        df = df[mask]
+    # a shallow copy, so adding or removing columns does not change the cached data
+    return df.copy(deep=False) if columns is None else df[columns]
+
+
+def write_csv(df, path, index=True):
+    """
+    Write a DataFrame to a ';'-separated CSV file.
+
+    The multithreaded pyarrow CSV writer is used if it is installed, otherwise pandas' `to_csv`.
+    Nested values (like the classifications) are written as text, as pandas would do.
+
+    :param pd.DataFrame df: The data to write.
+    :param str path: The file to write to.
+    :param bool index: If True, the index is written as the first column.
+    """
+    try:
+        import pyarrow as pa
+        from pyarrow import csv
+
+        flat = df.reset_index() if index else df
+        table = pa.Table.from_pandas(flat, preserve_index=False)
+        for i, field in enumerate(table.schema):
+            if pa.types.is_nested(field.type):
+                text = flat[field.name].astype(str).where(flat[field.name].notna())
+                table = table.set_column(
+                    i, field.name, pa.array(text, type=pa.string(), from_pandas=True)
+                )
+        csv.write_csv(table, path, write_options=csv.WriteOptions(delimiter=";"))
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        df.to_csv(path, sep=";", index=index)
+
+
+def read_csv(path):
+    """
+    Read a CSV file written by :func:`write_csv`.
+
+    The pyarrow CSV writer writes whole floats without a decimal point (-1.0 as -1),
+    so the amounts are read as floats, not as integers.
+
+    :param str path: The file to read.
+    :returns: pd.DataFrame with the first column as the index.
+    """
+    return pd.read_csv(path, sep=";", header=0, index_col=0, dtype={"ex_amount": float})
+
 
 def ExplodeDatabase(db_name):
     """
@@ -29,18 +186,20 @@ def ExplodeDatabase(db_name):
     """
     from config.user_settings import dir_logs, dir_tmp
 
-    if not os.path.isdir(dir_tmp):
-        os.makedirs(dir_tmp)
-    if not os.path.isdir(dir_logs):
-        os.makedirs(dir_logs)
+    os.makedirs(dir_tmp, exist_ok=True)
+    os.makedirs(dir_logs, exist_ok=True)
 
     print("\n*** Starting ExplodeDatabase ***")
     print(
-        "ExplodeDatabase uses wurst to open a bw2 database, explodes the exchanges for each process, and then returns a pickle file with a DataFrame list of all activities"
+        "ExplodeDatabase uses wurst to open a bw2 database, explodes the exchanges for each process, and then saves a parquet (or pickle) file with a DataFrame list of all activities"
     )
 
-    # Set the path to save the pickle file
+    # Set the paths to save the file, remove old files so they can't be loaded instead of the new one
+    parquet_path = dir_tmp / f"{db_name}_exploded.parquet"
     pickle_path = dir_tmp / f"{db_name}_exploded.pickle"
+    for path in [parquet_path, pickle_path]:
+        if os.path.isfile(path):
+            os.remove(path)
 
     # Extract information from the specified database
     db = bd.Database(db_name)
@@ -50,42 +209,72 @@ def ExplodeDatabase(db_name):
     print("\n** Opening the sausage...")
     guts = w.extract_brightway2_databases(db_name)
 
-    # Create a DataFrame from the extracted data
+    # Build one flat row per exchange, with the details of its activity
     print("\n*** Extracting activities from db...")
-    df = pd.DataFrame(
-        guts,
-        columns=[
-            "code",
-            "name",
-            "location",
-            "reference product",
-            "categories",
-            "classifications",
-            "exchanges",
-        ],
-    )
+    act_fields = [
+        "code",
+        "name",
+        "location",
+        "reference product",
+        "categories",
+        "classifications",
+    ]
+    ex_fields = [
+        "name",
+        "amount",
+        "unit",
+        "product",
+        "production volume",
+        "type",
+        "location",
+    ]
 
-    # Expand the exchanges column into a new DataFrame and join it with the original data
     print("\n*** Exploding exchanges from activities...")
-    df = df.explode("exchanges", ignore_index=True)
-    df_ex = pd.json_normalize(df.exchanges, max_level=0)
-    df_ex = df_ex[
-        ["name", "amount", "unit", "product", "production volume", "type", "location"]
-    ]
-    df_ex = df_ex.add_prefix("ex_")
-    df = df.join(df_ex)
+    rows = []
+    for act in guts:
+        act_row = tuple(act.get(field) for field in act_fields)
+        # an activity without exchanges still gets a row, as with DataFrame.explode
+        for ex in act.get("exchanges") or [{}]:
+            rows.append(act_row + tuple(ex.get(field) for field in ex_fields))
+    del guts
+
+    # and make the DataFrame from all rows at once
+    df = pd.DataFrame.from_records(
+        rows, columns=act_fields + ["ex_" + field for field in ex_fields]
+    )
+    del rows
+
+    # The units, types and locations have few distinct values, so they are stored as categories
+    for column in ["ex_unit", "ex_type", "ex_location"]:
+        df[column] = df[column].astype("category")
 
-    # Finalize the DataFrame by setting the index and removing the now redundant exchanges column
-    df = df.drop("exchanges", axis=1)
+    # Finalize the DataFrame by setting the index
     df.set_index("code", inplace=True)
 
-    # Save the DataFrame as a pickle file
-    print("\n*** Pickling...")
-    df.to_pickle(pickle_path)
-    print("\n Pickle is:", "%1.0f" % (os.path.getsize(pickle_path) / 1024**2), "MB")
+    # Save the DataFrame as a parquet file, or as a pickle file if that is not possible
+    try:
+        print("\n*** Writing parquet...")
+        df.to_parquet(
+            parquet_path,
+            engine="pyarrow",
+            compression="zstd",
+            row_group_size=64_000,
+        )
+        save_path = parquet_path
+    except (ImportError, ValueError, TypeError, NotImplementedError) as e:
+        print(f"\n Could not write parquet ({e}), pickling instead...")
+        if os.path.isfile(parquet_path):
+            os.remove(parquet_path)
+        df.to_pickle(pickle_path)
+        save_path = pickle_path
+        # a pickle loads back exactly as it was saved, so the searches can use the DataFrame in memory
+        # (a parquet file is read back, its column types can differ from the DataFrame that was saved)
+        exploded_cache.clear()
+        exploded_cache[(str(pickle_path), os.path.getmtime(pickle_path))] = df
+    print("\n File is:", "%1.0f" % (os.path.getsize(save_path) / 1024**2), "MB")
 
     # Log the operation with a timestamp, database name, and project name
-    print("\n*** The sausage <" + db.name + "> was exploded and pickled. Rejoice!")
+    print("\n*** The sausage <" + db.name + "> was exploded and saved. Rejoice!")
 
     log_entry = (
         datetime.now().strftime("%Y-%m-%d %H:%M:%S")
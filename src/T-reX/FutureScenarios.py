@@ -36,40 +36,21 @@ from config.user_settings import (
 )
 
 
-if use_premise:
-    # easiest way to stop premise from making a mess in the main directory
-    dir_premise = dir_data / "premise"
-    os.makedirs(dir_premise, exist_ok=True)
-    os.chdir(dir_premise)
+# easiest way to stop premise from making a mess in the main directory,
+# MakeFutureScenarios() imports and runs premise in this directory
+dir_premise = dir_data / "premise"
 
-    import premise as pm
-    from premise_gwp import add_premise_gwp
-
-    # Initialize logging with timestamp
-    if not os.path.exists(dir_logs):
-        os.makedirs(dir_logs)
-
-    log_filename = (
-        dir_logs / f'{datetime.now().strftime("%Y-%m-%d")}_FutureScenarios.log'
-    )
-    logging.basicConfig(filename=log_filename, level=logging.INFO)
-
-    # Function to split scenarios into smaller groups (for batch processing)
-    def grouper(iterable, n, fillvalue=None):
-        args = [iter(iterable)] * n
-        return zip_longest(*args, fillvalue=fillvalue)
 
-    # ---------------------------------------------------------------------------------
-    # FILTER OUT SCENARIOS THAT ARE NOT AVAILABLE
-    # ---------------------------------------------------------------------------------
+# Function to split scenarios into smaller groups (for batch processing)
+def grouper(iterable, n, fillvalue=None):
+    args = [iter(iterable)] * n
+    return zip_longest(*args, fillvalue=fillvalue)
 
-    SCENARIO_DIR = pm.filesystem_constants.DATA_DIR / "iam_output_files"
-    filenames = sorted([x for x in os.listdir(SCENARIO_DIR) if x.endswith(".csv")])
 
-    # Split the string and extract the version number
-    # parts = database_name.split("_")
-    # source_version = parts[1] if "." in parts[1] else parts[1].split(".")[0]
-    # source_systemmodel = parts[-1]
+# Split the string and extract the version number
+# parts = database_name.split("_")
+# source_version = parts[1] if "." in parts[1] else parts[1].split(".")[0]
+# source_systemmodel = parts[-1]
 
 
 # function to make arguments for "new database -- pm.nbd" based on possible scenarios
@@ -150,6 +131,9 @@ def FutureScenarios(scenario_list):
 
     :raises Exception: If an error occurs during the processing of scenarios or database creation.
     """
+    import premise as pm
+    from premise_gwp import add_premise_gwp
+
     print("*** Starting FutureScenarios.py ***")
     print(f"\tUsing premise version {pm.__version__}")
 
@@ -269,9 +253,6 @@ def FutureScenarios(scenario_list):
     print("***** Done! *****")
     logging.info("Done!")
 
-    # change back to the original directory
-    os.chdir(dir_data.parent)
-
 
 def MakeFutureScenarios():
     """
@@ -282,11 +263,36 @@ def MakeFutureScenarios():
     """
 
     if use_premise:
-        available_scenarios = make_possible_scenario_list(
-            filenames, desired_scenarios, years
+        # Initialize logging with timestamp, the log is opened here and not on import,
+        # so main.py can move the old logs away first (see delete_T_reX_data)
+        os.makedirs(dir_logs, exist_ok=True)
+
+        log_filename = (
+            dir_logs / f'{datetime.now().strftime("%Y-%m-%d")}_FutureScenarios.log'
         )
-        scenario_list = check_existing(available_scenarios)
-        FutureScenarios(scenario_list)
+        logging.basicConfig(filename=log_filename, level=logging.INFO)
+
+        # change to the premise directory while premise is imported and runs, then change back
+        os.makedirs(dir_premise, exist_ok=True)
+        cwd = os.getcwd()
+        os.chdir(dir_premise)
+        try:
+            import premise as pm
+
+            # filter out scenarios that are not available
+            SCENARIO_DIR = pm.filesystem_constants.DATA_DIR / "iam_output_files"
+            filenames = sorted(
+                [x for x in os.listdir(SCENARIO_DIR) if x.endswith(".csv")]
+            )
+
+            available_scenarios = make_possible_scenario_list(
+                filenames, desired_scenarios, years
+            )
+            scenario_list = check_existing(available_scenarios)
+
+            FutureScenarios(scenario_list)
+        finally:
+            os.chdir(cwd)
     else:
         print("Premise not called for, continuing...")
 
@@ -12,11 +12,12 @@ Main functions:
 """
 
 import glob
+import hashlib
 import os
 
 import bw2data as bd
 import bw2io as bi
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
 from config.user_settings import (
     db_T_reX_name,
     dir_databases_T_reX,
@@ -57,39 +58,47 @@ def dbWriteExcel():
     Create an xlsx file representing a custom Brightway2 database.
 
     This function generates an Excel file which represents a custom database for Brightway2,
-    using predefined directory and database settings.
+    using predefined directory and database settings. An existing file is reused when it
+    was written for the same search results.
 
     :return: Path to the generated xlsx file.
     """
 
-    if not os.path.isdir(dir_databases_T_reX):
-        os.makedirs(dir_databases_T_reX)
+    os.makedirs(dir_databases_T_reX, exist_ok=True)
 
     xl_filename = dir_databases_T_reX / f"{db_T_reX_name}.xlsx"
 
+    # the file only depends on the names of the search results,
+    # so it is not written again if they are the same as for the existing file
+    names = get_files_from_tree(dir_searchmaterial_results, dir_searchwaste_results)
+    key_file = xl_filename.with_suffix(".key")
+    names_key = hashlib.sha256(repr((db_T_reX_name, names)).encode()).hexdigest()
+    if (
+        os.path.isfile(xl_filename)
+        and key_file.is_file()
+        and key_file.read_text() == names_key
+    ):
+        print(f"\n\n*** Existing custom database file found: {xl_filename}\n")
+        return xl_filename
+
     # delete existing file if it exists
+    key_file.unlink(missing_ok=True)
     if os.path.isfile(xl_filename):
         os.remove(xl_filename)
 
-    # create new file and write header
+    # create new file and write header, the rows are streamed to the file
+    # when it is saved, instead of saving the header and opening the file again
     print(f"\n\n*** Writing custom database file: {db_T_reX_name}\n")
 
-    xl = Workbook()
-    xl_db = xl.active
-    xl_db["A1"] = "Database"
-    xl_db["B1"] = db_T_reX_name
-    xl_db["A2"] = ""
-
-    xl.save(xl_filename)
+    xl = Workbook(write_only=True)
+    xl_db = xl.create_sheet("Sheet")
+    xl_db.append(["Database", db_T_reX_name])
+    xl_db.append([""])
 
-    # open existing file and append to it
-    print(f"\n\n*** Appending to existing custom database file: {db_T_reX_name}\n")
-
-    xl = load_workbook(xl_filename)
-    xl_db = xl.active
+    # append the activities
+    print(f"\n\n*** Appending to custom database file: {db_T_reX_name}\n")
 
     count = 0
-    names = get_files_from_tree(dir_searchmaterial_results, dir_searchwaste_results)
     for NAME in names:
         count += 1
         CODE = NAME
@@ -125,11 +134,12 @@ def dbWriteExcel():
         xl_db.append([""])
 
     xl.save(xl_filename)
+    key_file.write_text(names_key)
     print(
         f"\n ** Added {count} entries to the xlsx for the custom waste and material database:\n\t{db_T_reX_name}"
     )
 
-    return
+    return xl_filename
 
 
 def determine_unit_from_name(name):
@@ -151,20 +161,22 @@ def determine_unit_from_name(name):
         return ""
 
 
-def dbExcel2BW():
+def dbExcel2BW(xl_filename=None):
     """
     Import the custom database (created by dbWriteExcel) into Brightway2.
 
     This function imports a custom Brightway2 database from an Excel file into the Brightway2 software,
     making it available for further environmental impact analysis.
 
+    :param xl_filename: Path to the xlsx file returned by dbWriteExcel (default: the file in `dir_databases_T_reX`).
     :return: None
     """
     print(
         f"\n** Importing the custom database {db_T_reX_name}**\n\t to the brightway2 project: {project_T_reX}"
     )
 
-    xl_filename = dir_databases_T_reX / f"{db_T_reX_name}.xlsx"
+    if xl_filename is None:
+        xl_filename = dir_databases_T_reX / f"{db_T_reX_name}.xlsx"
     bd.projects.set_current(project_T_reX)
 
     if db_T_reX_name not in bd.databases:
@@ -204,5 +216,5 @@ def dbExcel2BW():
 
 
 if __name__ == "__main__":
-    dbWriteExcel()
-    dbExcel2BW()
+    xl_filename = dbWriteExcel()
+    dbExcel2BW(xl_filename)
@@ -2,15 +2,19 @@
 SearchMaterial Module
 =====================
 
-This script loads data from '<db name>_exploded.pickle', runs search queries,
+This script loads data from '<db name>_exploded.parquet' (or '.pickle'), runs search queries,
 and produces a CSV to store the results and a log entry. The search queries are
 formatted as dictionaries with fields NAME, CODE, and search terms keywords_AND,
 keywords_OR, and keywords_NOT. These queries are defined in `config/queries_waste.py`.
 
 """
 
+import io
 import os
 import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import bw2data as bd
 import pandas as pd
@@ -22,9 +26,10 @@ from config.user_settings import (
     dir_tmp,
     project_T_reX,
 )
+from ExplodeDatabase import exploded_path, load_exploded, write_csv
 
 
-def SearchMaterial(db_name, project_T_reX=project_T_reX):
+def SearchMaterial(db_name, project_T_reX=project_T_reX, quiet=False):
     """
     Search for materials in a specified database and extract related information.
 
@@ -35,38 +40,39 @@ def SearchMaterial(db_name, project_T_reX=project_T_reX):
 
     :param db_name: The name of the database to search in.
     :param project_T_reX: The Brightway2 project to set as current for the search.
-    :return: None
+    :param quiet: If True, the messages are returned instead of printed.
+    :return: The messages as a string if quiet, else None.
     :raises Exception: If there is any error in reading the materials list from the file.
     """
 
+    # When quiet, the messages are held back, e.g. to print them after the output
+    # of a search that runs at the same time
+    messages = io.StringIO() if quiet else sys.stdout
+    report = partial(print, file=messages)
+
     # Configuring search result directories
     dir_searchmaterial_results_db = dir_searchmaterial_results / db_name
     dir_searchmaterial_results_grouped = dir_searchmaterial_results_db / "grouped"
 
     if os.path.isdir(dir_searchmaterial_results_db):
-        print("Deleting existing results directory")
+        report("Deleting existing results directory")
         shutil.rmtree(dir_searchmaterial_results_db)
 
     # Ensure necessary directories exist
     for directory in [dir_tmp, dir_logs, dir_searchmaterial_results_grouped]:
-        if not directory.exists():
-            directory.mkdir(parents=True)
-    print("\n*** Starting SearchMaterial ***")
-    pickle_path = dir_tmp / f"{db_name}_exploded.pickle"
-
-    if os.path.isfile(pickle_path):
-        df = pd.read_pickle(pickle_path)
-        print("*** Loading pickle to dataframe ***")
-    else:
-        print("Pickle file does not exist.")
-        return
+        directory.mkdir(parents=True, exist_ok=True)
+    report("\n*** Starting SearchMaterial ***")
+    if exploded_path(db_name) is None:
+        report("Exploded database file does not exist.")
+        return messages.getvalue() if quiet else None
 
-    # Set the current project
-    bd.projects.set_current(project_T_reX)
+    # Set the current project, if it is not already
+    if bd.projects.current != project_T_reX:
+        bd.projects.set_current(project_T_reX)
 
     # Load the database
     db = bd.Database(db_name)
-    print(
+    report(
         f"\n*** Loading activities \nfrom database: {db.name} \nin project: {project_T_reX}"
     )
 
@@ -87,8 +93,8 @@ def SearchMaterial(db_name, project_T_reX=project_T_reX):
     materials = queries_materials
 
     # Display loaded materials
-    print(f"\n** Materials ({len(materials)}) | (activity, group)\n", end="\t")
-    print(*materials, sep="\n\t")
+    report(f"\n** Materials ({len(materials)}) | (activity, group)\n", end="\t")
+    report(*materials, sep="\n\t")
 
     # Filter activities based on the materials list
     materials_df = pd.DataFrame(queries_materials, columns=["name", "group"])
@@ -96,9 +102,7 @@ def SearchMaterial(db_name, project_T_reX=project_T_reX):
 
     # changed search criteria to include all activities that contain the material name, because future databases have different naming conventions
     acts = acts_all[
-        acts_all["name"].apply(
-            lambda x: any(x.startswith(material) for material in materials_df.name)
-        )
+        acts_all["name"].str.startswith(tuple(materials_df.name), na=False)
     ].reset_index(drop=True)
 
     def map_materials(name):
@@ -109,42 +113,43 @@ def SearchMaterial(db_name, project_T_reX=project_T_reX):
 
     acts["material_group"] = acts["name"].apply(map_materials)
 
-    print(f"\n* {len(acts)} material markets were found:")
-    print(acts[["name", "material_group", "location"]].sort_values(by="name"))
+    report(f"\n* {len(acts)} material markets were found:")
+    report(acts[["name", "material_group", "location"]].sort_values(by="name"))
 
     # Extract and populate ISIC and CPC classifications
-    def extract_classifications(row, acts):
+    # the first classifications found for each reference product, used when an activity has none
+    classifications_by_product = {}
+    for product, classifications in zip(
+        acts["reference product"], acts["classifications"]
+    ):
+        classifications_by_product.setdefault(product, classifications)
+
+    def extract_classifications(row):
         """
         Extracts classifications (CPC, ISIC, etc.) from the list of classifications and adds them as columns to the dataframe
 
-        :param pd.Series row: A row of the dataframe
-        :param pd.DataFrame acts: The DataFrame containing activities data
+        :param dict row: A row of the dataframe, as a dict
 
-        :returns pd.Series row: The row with the classifications added as columns
+        :returns dict row: The row with the classifications added as columns
         """
 
         # Check if the "classifications" column exists and is in the correct format
         if not isinstance(row["classifications"], list):
-            print(
+            report(
                 f'\tError for activity: {row["name"]}, classification: {row["classifications"]}'
             )
-            print(
+            report(
                 f'\t\tInferring from reference product base: "{row["reference product"].split(",")[0]}", from reference product "{row["reference product"]}"'
             )
 
             # Find activities with the same or similar "reference product"
-            matching_activities = acts[
-                acts["reference product"] == row["reference product"].split(",")[0]
-            ]
+            product = row["reference product"].split(",")[0]
 
-            if not matching_activities.empty:
+            if product in classifications_by_product:
                 # Choose the first matching activity and use its classifications
-                inferred_classifications = matching_activities.iloc[0][
-                    "classifications"
-                ]
-                row["classifications"] = inferred_classifications
+                row["classifications"] = classifications_by_product[product]
             else:
-                print(
+                report(
                     f'No matching activities found for reference product: {row["reference product"]}'
                 )
 
@@ -158,44 +163,53 @@ def SearchMaterial(db_name, project_T_reX=project_T_reX):
 
         return row
 
-    print("\n* Extracting classifications...\n")
-    acts = acts.apply(lambda row: extract_classifications(row, acts), axis=1)
+    report("\n* Extracting classifications...\n")
+    acts = pd.DataFrame(
+        [extract_classifications(row) for row in acts.to_dict("records")]
+    )
     acts.drop("classifications", axis=1, inplace=True)
 
     # Save activities to a CSV
-    acts.to_csv(
-        dir_searchmaterial_results_db / "material_activities.csv", sep=";", index=False
+    write_csv(
+        acts, dir_searchmaterial_results_db / "material_activities.csv", index=False
     )
-    print(
+    report(
         f"\nSaved activities list to csv: \n{dir_searchmaterial_results_db / 'material_activities.csv'}"
     )
 
     # Load and filter exchanges
-    print(f"\n*** Searching for material exchanges in {db_name} ***")
-    print("\n*** Loading pickle to dataframe ***")
-    df = pd.read_pickle(pickle_path)
-    df = df[df.ex_type == "technosphere"]
+    report(f"\n*** Searching for material exchanges in {db_name} ***")
+    report("\n*** Loading exploded database to dataframe ***")
+    df = load_exploded(db_name, filters=[("ex_type", "==", "technosphere")])
     df.pop("classifications")
 
     hits = df[df["ex_name"].isin(acts["name"].values)].copy()
     hits = hits[hits["ex_amount"] != 0]
     hits["database"] = db_name
-    hits["material_group"] = hits["ex_name"].apply(map_materials)
-
-    # Save exchanges to CSV
-    file_name = dir_searchmaterial_results_db / "material_exchanges.csv"
-    hits.to_csv(file_name, sep=";")
-    print(f"\nThere were {len(hits)} matching exchanges found in {db_name}")
-    print(f"\nSaved material exchanges to csv:\n{file_name}")
-
-    # Generate and save grouped exchanges
-    print("\n*** Grouping material exchanges by material group \n")
-    for group in sorted(hits.material_group.unique()):
-        df_group = hits[hits.material_group == group]
-        file_name = (
-            dir_searchmaterial_results_grouped / f"MaterialFootprint_{group}.csv"
-        )
-        df_group.to_csv(file_name, sep=";")
-        print(f"\t{len(df_group):>6} : {group}")
-
-    return None
+    # the exchange names are all activity names, so the groups are looked up from acts
+    hits["material_group"] = hits["ex_name"].map(
+        dict(zip(acts["name"], acts["material_group"]))
+    )
+
+    # The CSVs are written in the background, while the exchanges are grouped
+    with ThreadPoolExecutor() as writer:
+        # Save exchanges to CSV
+        file_name = dir_searchmaterial_results_db / "material_exchanges.csv"
+        writes = [writer.submit(write_csv, hits, file_name)]
+        report(f"\nThere were {len(hits)} matching exchanges found in {db_name}")
+        report(f"\nSaved material exchanges to csv:\n{file_name}")
+
+        # Generate and save grouped exchanges, splitting the exchanges in one pass
+        report("\n*** Grouping material exchanges by material group \n")
+        for group, df_group in hits.groupby("material_group", sort=True):
+            file_name = (
+                dir_searchmaterial_results_grouped / f"MaterialFootprint_{group}.csv"
+            )
+            writes.append(writer.submit(write_csv, df_group, file_name))
+            report(f"\t{len(df_group):>6} : {group}")
+
+        # raise any error from writing the CSVs
+        for write in writes:
+            write.result()
+
+    return messages.getvalue() if quiet else None
@@ -2,29 +2,315 @@
 SearchWaste Module
 ==================
 
-This script loads data from '<db name>_exploded.pickle', runs search queries,
+This script loads data from '<db name>_exploded.parquet' (or '.pickle'), runs search queries,
 and produces CSV files to store the results and a log entry. The search queries are
 formatted as dictionaries with fields NAME, CODE, and search terms keywords_AND,
 keywords_OR, and keywords_NOT. These queries are defined in `config/queries_waste.py`.
 
 Functionality
 -------------
-Provides a function, :func:`SearchWaste`, that loads data from '<db name>_exploded.pickle',
+Provides a function, :func:`SearchWaste`, that loads data from '<db name>_exploded.parquet',
 runs search queries, and produces result CSVs and log entries.
 """
 
 import os
 import shutil
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from time import strftime
 
+import numpy as np
 import pandas as pd
 from config.queries_waste import queries_waste
-from config.user_settings import dir_logs, dir_searchwaste_results, dir_tmp
+from config.user_settings import dir_logs, dir_searchwaste_results
+from ExplodeDatabase import load_exploded, write_csv
+
+# numba is optional, without it the matching is done with numpy bitwise operations
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# polars is optional, it looks for each keyword in all names at once, using all cores
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# pyarrow is optional, its compute kernels are used for the keyword search if polars is not installed
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pc = None
+
+# pyahocorasick is optional, without it each keyword is looked up in each name separately
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def pack_bits(masks, n_words):
+    """
+    Split python integer bitmasks into rows of 64-bit words.
+
+    :param list masks: Bitmasks, where bit i is set if keyword i is present.
+    :param int n_words: Number of 64-bit words per row.
+    :returns: np.ndarray of shape (len(masks), n_words) and dtype uint64.
+    """
+    bits = np.zeros((len(masks), n_words), dtype=np.uint64)
+    for w in range(n_words):
+        bits[:, w] = np.fromiter(
+            ((m >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for m in masks),
+            dtype=np.uint64,
+            count=len(masks),
+        )
+    return bits
+
+
+def compile_name_mask(words, always=0):
+    """
+    Generate a function that returns the bitmask of the keywords found in a name.
+
+    The keywords are written into the source as literals, so there is no loop over the
+    keywords when the function is called, e.g. for {"ash": 1, "sludge": 2}::
+
+        def name_mask(name):
+            mask = 0
+            if 'ash' in name:
+                mask |= 1
+            if 'sludge' in name:
+                mask |= 2
+            return mask
+
+    :param dict words: Keyword -> bit value, for non-empty keywords.
+    :param int always: Bits that are set for every name.
+    :returns: function name_mask(name) -> int
+    """
+    lines = ["def name_mask(name):", f"    mask = {always}"]
+    for keyword, bit in words.items():
+        lines.append(f"    if {keyword!r} in name:")
+        lines.append(f"        mask |= {bit}")
+    lines.append("    return mask")
+
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["name_mask"]
+
+
+def name_masks(names, vocab):
+    """
+    Find the keywords contained in each name, as a python integer bitmask.
+
+    With pyahocorasick, all keywords are found in a single scan of each name.
+
+    :param names: Distinct exchange names.
+    :param dict vocab: Keyword -> bit mapping.
+    :returns: list of bitmasks, one per name.
+    """
+    # The empty keyword is in every name
+    always = sum(1 << i for keyword, i in vocab.items() if not keyword)
+    words = {keyword: 1 << i for keyword, i in vocab.items() if keyword}
+
+    if ahocorasick is None or not words:
+        name_mask = compile_name_mask(words, always)
+        return [name_mask(name) for name in names]
+
+    automaton = ahocorasick.Automaton()
+    for keyword, bit in words.items():
+        automaton.add_word(keyword, bit)
+    automaton.make_automaton()
+
+    masks = []
+    for name in names:
+        mask = always
+        for _, bit in automaton.iter(name):
+            mask |= bit
+        masks.append(mask)
+    return masks
+
+
+def substring_bits(names, vocab, n_words):
+    """
+    Build the keyword bitsets with one vectorised substring search per keyword.
+
+    The searches are done by polars (on all cores) if it is installed, otherwise by the
+    pyarrow compute kernels.
+
+    :param names: Distinct exchange names.
+    :param dict vocab: Keyword -> bit mapping.
+    :param int n_words: Number of 64-bit words per row.
+    :returns: np.ndarray of shape (len(names), n_words) and dtype uint64.
+    """
+    names = np.asarray(names, dtype=object)
+    if pl is not None:
+        column = pl.Series("ex_name", names, dtype=pl.Utf8)
+
+        def contains(keyword):
+            return column.str.contains(keyword, literal=True).to_numpy()
+
+    else:
+        column = pa.array(names, type=pa.string())
+
+        def contains(keyword):
+            return pc.match_substring(column, keyword).to_numpy(zero_copy_only=False)
+
+    bits = np.zeros((len(names), n_words), dtype=np.uint64)
+    for keyword, i in vocab.items():
+        bits[:, i // 64] |= contains(keyword).astype(np.uint64) << np.uint64(i % 64)
+    return bits
+
+
+def build_keyword_index(names, keywords):
+    """
+    Encode each distinct exchange name as a bitset of the query keywords it contains.
+
+    The substring tests are done once per distinct name, instead of once per row and per query.
+    Bit i of a name's bitset is set if keyword i is a substring of the name. Usually there are
+    fewer than 64 keywords, so each name fits in a single uint64 word.
+
+    :param pd.Series names: The `ex_name` column of the exploded database.
+    :param list keywords: All keywords used in the AND, OR and NOT fields of the queries.
+    :returns: tuple (vocab, codes, bits), where `vocab` maps keyword -> bit, `codes` maps
+        each row to its distinct name (-1 for missing names) and `bits` holds the bitsets.
+    """
+    vocab = {keyword: i for i, keyword in enumerate(sorted(set(keywords)))}
+    codes, uniques = pd.factorize(names)
+
+    n_words = max(1, -(-len(vocab) // 64))
+
+    if pl is not None or pc is not None:
+        bits = substring_bits(uniques, vocab, n_words)
+    else:
+        bits = pack_bits(name_masks(uniques, vocab), n_words)
+
+    return vocab, codes, bits
+
+
+def keyword_mask(vocab, terms, n_words):
+    """
+    Make the bitmask of a list of query keywords.
+
+    :param dict vocab: Keyword -> bit mapping, see :func:`build_keyword_index`.
+    :param list terms: The keywords (or None).
+    :param int n_words: Number of 64-bit words per bitset.
+    :returns: np.ndarray of n_words uint64 words.
+    """
+    return pack_bits([sum(1 << vocab[t] for t in set(terms or []))], n_words)[0]
+
+
+def match_keywords(bits, and_mask, or_mask, not_mask, candidates):
+    """
+    Find the distinct names that contain all AND, any OR (if given) and none of the NOT keywords.
+
+    Only the names that are already marked in `candidates` are tested, so a query can start
+    from the result of a query with fewer keywords.
+
+    :param np.ndarray bits: Bitsets of the names, see :func:`build_keyword_index`.
+    :param np.ndarray and_mask: Bitmask of the AND keywords.
+    :param np.ndarray or_mask: Bitmask of the OR keywords (all zero for no OR filter).
+    :param np.ndarray not_mask: Bitmask of the NOT keywords.
+    :param np.ndarray candidates: Boolean array of the names to test.
+    :returns: np.ndarray of bool, one entry per distinct name.
+    """
+    has_or = bool(or_mask.any())
+    if njit is not None:
+        hits = np.empty(bits.shape[0], dtype=np.bool_)
+        match_bits(bits, and_mask, or_mask, not_mask, has_or, candidates, hits)
+        return hits
+
+    # Only the candidate names are tested, so the working set shrinks with each filter
+    tested = np.flatnonzero(candidates)
+    subset = bits[tested]
+    keep = ((subset & and_mask) == and_mask).all(axis=1)
+    if has_or:
+        keep &= (subset & or_mask).any(axis=1)
+    keep &= ~(subset & not_mask).any(axis=1)
+
+    hits = np.zeros(bits.shape[0], dtype=np.bool_)
+    hits[tested[keep]] = True
+    return hits
+
+
+if njit is not None:
+
+    @njit(parallel=True, cache=True)
+    def match_bits(bits, and_mask, or_mask, not_mask, has_or, candidates, out):
+        """Fused version of the bitwise tests in :func:`match_keywords`, one pass per name."""
+        for r in prange(bits.shape[0]):
+            hit = candidates[r]
+            if not hit:
+                out[r] = False
+                continue
+            any_or = not has_or
+            for w in range(bits.shape[1]):
+                b = bits[r, w]
+                if (b & and_mask[w]) != and_mask[w] or (b & not_mask[w]) != 0:
+                    hit = False
+                    break
+                if (b & or_mask[w]) != 0:
+                    any_or = True
+            out[r] = hit and any_or
+
+
+Query = namedtuple(
+    "Query",
+    [
+        "name",
+        "units",
+        "and_terms",
+        "or_mask",
+        "not_mask",
+        "carbon_dioxide",
+        "csv_paths",
+        "log_entries",
+    ],
+)
+
+
+def prepare_queries(queries, vocab, n_words, dir_results):
+    """
+    Precompute everything that a query needs before the search loop starts.
+
+    :param list queries: Query dicts, as defined in `config/queries_waste.py`.
+    :param dict vocab: Keyword -> bit mapping, see :func:`build_keyword_index`.
+    :param int n_words: Number of 64-bit words per bitset.
+    :param str dir_results: Directory where the result CSVs are saved.
+    :returns: list of Query tuples, with the OR/NOT bitmasks, and the result file path and log text per unit.
+    """
+    prepared = []
+    for q in queries:
+        # queries with a single "unit" are still accepted
+        units = tuple(q["units"]) if "units" in q else (q["unit"],)
+        csv_paths = {}
+        log_entries = {}
+        for unit in units:
+            code = (q["name"] + "-" + unit).replace(" ", "")
+            csv_paths[unit] = os.path.join(dir_results, code + ".csv")
+            log_entries[unit] = (
+                f"NAME: {q['name']}, Search parameters, AND={q['AND']}, OR={q['OR']}, NOT={q['NOT']}, "
+                f"UNIT={unit}, CODE={code}\n"
+            )
+        prepared.append(
+            Query(
+                name=q["name"],
+                units=units,
+                and_terms=frozenset(q["AND"]),
+                or_mask=keyword_mask(vocab, q["OR"], n_words),
+                not_mask=keyword_mask(vocab, q["NOT"], n_words),
+                carbon_dioxide="carbon dioxide" in q["name"],
+                csv_paths=csv_paths,
+                log_entries=log_entries,
+            )
+        )
+    return prepared
 
 
 def SearchWaste(db_name, dir_searchwaste_results=dir_searchwaste_results):
     """
-    Load data from '<db name>_exploded.pickle', run search queries, and produce
+    Load data from '<db name>_exploded.parquet', run search queries, and produce
     result CSVs and log entries.
 
     This function processes waste-related data from a given database and runs
@@ -45,105 +331,148 @@ def SearchWaste(db_name, dir_searchwaste_results=dir_searchwaste_results):
         shutil.rmtree(dir_searchwaste_results)
 
     # Ensure necessary directories exist
-    if not os.path.exists(dir_logs):
-        os.makedirs(dir_logs)
-    if not os.path.exists(dir_searchwaste_results):
-        os.makedirs(dir_searchwaste_results)
+    os.makedirs(dir_logs, exist_ok=True)
+    os.makedirs(dir_searchwaste_results, exist_ok=True)
 
     # Load dataset
-    pickle_path = os.path.join(dir_tmp, db_name + "_exploded.pickle")
-    if os.path.isfile(pickle_path):
-        df = pd.read_pickle(pickle_path)
-        print("*** Loading pickle to dataframe ***")
+    df = load_exploded(db_name)
+    if df is not None:
+        print("*** Loading exploded database to dataframe ***")
     else:
-        print("Pickle file does not exist.")
+        print("Exploded database file does not exist.")
         return
 
     print("*** Searching for waste exchanges ***")
 
+    # Encode the exchange names once for all queries
+    keywords = [
+        keyword
+        for query in queries_waste
+        for keyword in query["AND"] + (query["OR"] or []) + (query["NOT"] or [])
+    ]
+    vocab, codes, bits = build_keyword_index(df["ex_name"], keywords)
+    n_words = bits.shape[1]
+    no_keywords = keyword_mask(vocab, None, n_words)
+
+    # Masks that are shared between queries: names matching a set of AND keywords,
+    # rows with a unit and an amount sign, and the names that occur with a unit
+    and_cache = {frozenset(): np.ones(bits.shape[0], dtype=np.bool_)}
+    unit_cache = {}
+    base_cache = {}
+
+    def match_and(terms):
+        """Names containing all `terms`, starting from the largest cached subset of them."""
+        key = frozenset(terms)
+        if key not in and_cache:
+            subset = max((k for k in and_cache if k <= key), key=len)
+            and_cache[key] = match_keywords(
+                bits,
+                keyword_mask(vocab, key - subset, n_words),
+                no_keywords,
+                no_keywords,
+                and_cache[subset],
+            )
+        return and_cache[key]
+
+    # The units are compared as integer category codes instead of strings
+    units = df["ex_unit"].astype("category")
+    unit_codes = units.cat.codes.to_numpy()
+    unit_ids = {unit: i for i, unit in enumerate(units.cat.categories)}
+
+    # The sign of the amount is the last filter of each query
+    amounts = df["ex_amount"].to_numpy()
+    positive = amounts > 0
+    negative = amounts < 0
+
+    def match_unit(unit):
+        """Rows with `unit` and a name, and the distinct names that occur with `unit`."""
+        if unit not in unit_cache:
+            rows = (unit_codes == unit_ids.get(unit, -2)) & (codes >= 0)
+            names = np.bincount(codes[rows], minlength=bits.shape[0]) > 0
+            unit_cache[unit] = (rows, names)
+        return unit_cache[unit]
+
+    def match_base(unit, carbon_dioxide):
+        """Positions (and name codes) of the rows with `unit` and the amount sign that the query keeps."""
+        key = (unit, carbon_dioxide)
+        if key not in base_cache:
+            rows, _ = match_unit(unit)
+            positions = np.flatnonzero(
+                rows & (positive if carbon_dioxide else negative)
+            )
+            base_cache[key] = (positions, codes[positions])
+        return base_cache[key]
+
     def search(query):
         """
         Execute an individual search query on the dataset.
 
         Parameters:
-        - query (dict): Search query defined in `config/queries_waste.py`.
+        - query (Query): Search query defined in `config/queries_waste.py`, prepared by :func:`prepare_queries`.
 
         Returns:
-        A CSV file with search results, saved to `data/SearchWasteResults/<db_name>` with the query name.
+        A CSV file with search results per unit, saved to `data/SearchWasteResults/<db_name>` with the query name.
         """
 
-        # Extract and process query components (for readability in the code)
-        NAME_BASE = query["name"]
-        UNIT = query["unit"]
-        NAME = NAME_BASE + "-" + UNIT
-        CODE = NAME.replace(" ", "")
-        query.update({"code": NAME, "db_name": db_name})
-        AND = query["AND"]
-        OR = query["OR"]
-        NOT = query["NOT"]
-        DBNAME = query["db_name"]
-
-        # Apply the search terms to the dataframe
-        df_results = df[
-            (df["ex_name"].apply(lambda x: all(i in x for i in AND)))
-            & (df["ex_unit"] == UNIT)
-            # & (df["ex_amount"] != 1)
-            # & (df["ex_type"].isin(['technosphere', 'production']))
-        ].copy()
-
-        if df_results.shape[0] == 0:
-            print(f"\t\t** No results for {NAME}")
-            return
-
-        if OR:
-            df_results = df_results[
-                df_results["ex_name"].apply(lambda x: any(i in x for i in OR))
-            ]
-
-        if df_results.shape[0] == 0:
-            print(f"\t\t** No results for {NAME}")
-            return
-
-        if NOT:
-            df_results = df_results[
-                df_results["ex_name"].apply(lambda x: not any(i in x for i in NOT))
-            ]
-
-        if df_results.shape[0] == 0:
-            print(f"\t\t** No results for {NAME}")
-            return
-
-        if "carbon dioxide" in NAME_BASE:
-            df_results = df_results[df_results["ex_amount"] > 0]
-            df_results["ex_amount"] = -df_results["ex_amount"]
-        else:
-            df_results = df_results[df_results["ex_amount"] < 0]
-        # Save results to CSV
-        T_reX_file_name = NAME.replace(" ", "")
-        T_reX_file = os.path.join(dir_searchwaste_results, T_reX_file_name)
-        df_results["database"] = DBNAME
-        if df_results.shape[0] != 0:
-            df_results.to_csv(T_reX_file + ".csv", sep=";")
-
-        # Log the results
-        log_entry = (
-            f"TIME: {datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}, DB: {db_name}, RESULTS: {df_results.shape[0]}, "
-            f"NAME: {query['name']}, Search parameters, AND={query['AND']}, OR={query['OR']}, NOT={query['NOT']}, "
-            f"UNIT={query['unit']}, CODE={CODE}"
+        # The cheapest filters go first: only the names that occur with one of the units
+        # are tested against the search terms, once for all units, and only the rows with
+        # the unit and amount sign are mapped back to their names
+        unit_names = {unit: match_unit(unit)[1] for unit in query.units}
+        matches_any_unit = match_keywords(
+            bits,
+            no_keywords,
+            query.or_mask,
+            query.not_mask,
+            match_and(query.and_terms)
+            & np.logical_or.reduce(list(unit_names.values())),
         )
 
-        date = datetime.now().strftime("%Y%m%d")
-        log_file = os.path.join(dir_logs, f"SearchWaste_{date}.log")
-        with open(log_file, "a") as l:
-            l.write(str(log_entry) + "\n")
+        for unit in query.units:
+            matches = matches_any_unit & unit_names[unit]
+            if not matches.any():
+                print(f"\t\t** No results for {query.name}-{unit}")
+                continue
 
-        print(
-            f"\t{query['name']:<25} \t| {query['unit']:<13} \t| {df_results.shape[0]:>6}"
-        )
+            # Only the rows that pass every filter are taken from the dataframe
+            positions, position_codes = match_base(unit, query.carbon_dioxide)
+            df_results = df.iloc[positions[matches[position_codes]]].assign(
+                database=db_name
+            )
+            if query.carbon_dioxide:
+                df_results["ex_amount"] = -df_results["ex_amount"]
+            # Save results to CSV, in the background while the next queries run
+            if df_results.shape[0] != 0:
+                writes.append(
+                    writer.submit(write_csv, df_results, query.csv_paths[unit])
+                )
+
+            # Log the results
+            log_entries.append(
+                f"TIME: {strftime('%Y-%m-%d_%H:%M:%S')}, DB: {db_name}, RESULTS: {df_results.shape[0]}, "
+                + query.log_entries[unit]
+            )
+
+            print(f"\t{query.name:<25} \t| {unit:<13} \t| {df_results.shape[0]:>6}")
+
+    # The log entries are collected and written to the log file in one go
+    date = datetime.now().strftime("%Y%m%d")
+    log_file = os.path.join(dir_logs, f"SearchWaste_{date}.log")
+    log_entries = []
 
-    # Execute each query using the search() function defined above
-    for query in queries_waste:
-        search(query)
+    # Execute each query using the search() function defined above,
+    # queries with fewer AND keywords go first so their masks can be reused
+    queries = prepare_queries(queries_waste, vocab, n_words, dir_searchwaste_results)
+    writes = []
+    try:
+        with ThreadPoolExecutor() as writer:
+            for query in sorted(queries, key=lambda q: len(q.and_terms)):
+                search(query)
+            # raise any error from writing the CSVs
+            for write in writes:
+                write.result()
+    finally:
+        with open(log_file, "a") as log:
+            log.writelines(log_entries)
 
     print("*** Finished searching for waste exchanges ***")
 
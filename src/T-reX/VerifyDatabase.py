@@ -9,10 +9,7 @@ for random activities within the specified database using selected methods.
 
 from datetime import datetime
 from pathlib import Path
-from random import choice
-
-import bw2calc as bc
-import bw2data as bd
+from random import choices
 
 
 def VerifyDatabase(
@@ -34,13 +31,23 @@ def VerifyDatabase(
     :return: Exit code (0 for success, 1 for failure).
     """
 
+    # screen for biosphere and T-reX databases, before paying for the Brightway imports
+    if any(word in database_name for word in ["biosphere", "T-reX"]):
+        print(f"Skipping {database_name}...")
+        exit_code = 0
+        return exit_code
+
+    import bw2calc as bc
+    import bw2data as bd
+
     # setup to log the result
     exit_code = 0
     if log:
         current_date = datetime.now().strftime("%Y%m%d")
-        log_dir = Path("../../data/logs")
-        if not log_dir.exists():
-            log_dir = Path.cwd()
+        from config.user_settings import dir_logs
+
+        log_dir = Path(dir_logs)
+        log_dir.mkdir(parents=True, exist_ok=True)
         log_file = log_dir / f"{current_date}_{project_name}.log"
 
     # Set the current project in Brightway2
@@ -52,16 +59,9 @@ def VerifyDatabase(
         exit_code = 1
         return exit_code
 
-    # screen for biosphere and T-reX databases
-
-    if any(word in database_name for word in ["biosphere", "T-reX"]):
-        print(f"Skipping {database_name}...")
-        exit_code = 0
-        return exit_code
-
     # Load the database
     if database_name in bd.databases:
-        bd.Database(database_name)
+        db = bd.Database(database_name)
     else:
         print(f"Database {database_name} not found...")
         print(*bd.databases, sep="\n")
@@ -70,40 +70,48 @@ def VerifyDatabase(
 
     print(f"\n** Verifying database {database_name} in project {project_name} **\n")
 
-    # Initialize the score
-    lca_score = 0
-    count = 0
-    # Loop until a non-zero score is obtained
-    while lca_score == 0 and count < 5:
-        try:
-            count += 1
-            # Get a random activity from the database
-            act = bd.Database(database_name).random()
+    # Initialize the list of methods, bd.methods does not change between the attempts
+    methods = []
 
-            # Initialize the list of methods
-            methods = []
+    # Find methods related to Waste Footprint
+    if check_waste:
+        methods += [x for x in bd.methods if "Waste" in x[1]]
 
-            # Find methods related to Waste Footprint
-            if check_waste:
-                methods_waste = [x for x in bd.methods if "Waste" in x[1]]
-                methods += methods_waste
+    # Find methods related to Material Demand Footprint
+    if check_material:
+        methods += [x for x in bd.methods if "Demand" in x[1]]
 
-            # Find methods related to Material Demand Footprint
-            if check_material:
-                methods_material = [x for x in bd.methods if "Demand" in x[1]]
-                methods += methods_material
+    # Otherwise any method will do
+    if not check_waste and not check_material:
+        methods = list(bd.methods)
 
-            if not check_waste and not check_material:
-                method = bd.methods.random()
-                methods.append(method)
+    if not methods:
+        print(f"No methods found to verify {database_name}...")
+        exit_code = 1
+        return exit_code
 
-            # Choose a random method
-            method = choice(methods)
+    # Choose a random method for each of the (at most 5) attempts
+    attempts = choices(methods, k=5)
 
-            # Perform LCA calculation
-            lca = bc.LCA({act: 1}, method)
-            lca.lci()
-            lca.lcia()
+    # Initialize the LCA, which is reused between the attempts, and the log
+    lca = None
+    log_statements = []
+    # Loop until a non-zero score is obtained
+    for method in attempts:
+        try:
+            # Get a random activity from the database
+            act = db.random()
+
+            # Perform LCA calculation, the matrices are only built on the first attempt
+            if lca is None:
+                lca = bc.LCA({act: 1}, method)
+                lca.lci(factorize=True)
+                lca.lcia()
+            else:
+                lca.redo_lci({act: 1})
+                if method != lca.method:
+                    lca.switch_method(method)
+                lca.redo_lcia()
 
             # Get the lca score
             lca_score = lca.score
@@ -121,10 +129,15 @@ def VerifyDatabase(
             break
 
         print(log_statement)
-        # Log the result
-        if log:
-            with open(log_file, "a") as f:
-                f.write(log_statement + "\n")
+        log_statements.append(log_statement + "\n")
+
+        if lca_score != 0:
+            break
+
+    # Log the results of all attempts
+    if log:
+        with open(log_file, "a") as f:
+            f.writelines(log_statements)
 
     return exit_code
 
@@ -2,6 +2,7 @@
 from .user_settings import (
     custom_bw2_dir,
     db_T_reX_name,
+    delete_T_reX_data,
     delete_T_reX_project,
     dir_logs,
     dir_tmp,
@@ -23,6 +24,7 @@ from .queries_materials import queries_materials
 __all__ = [
     "custom_bw2_dir",
     "db_T_reX_name",
+    "delete_T_reX_data",
     "delete_T_reX_project",
     "dir_logs",
     "dir_tmp",
@@ -19,6 +19,7 @@ Premise can also be used to make future databases (`use_premise` is True).
 
 import os
 import shutil
+import threading
 from itertools import product
 from pathlib import Path
 
@@ -220,11 +221,38 @@ dir_T_reX = [
     dir_databases_T_reX,
 ]
 
-# this will delete old results and logs
-if delete_T_reX_project:
+
+# this will delete old results and logs, it is called by main.py if delete_T_reX_project is True
+def delete_T_reX_data():
+    """
+    Delete the old results and logs of the T-reX tool.
+
+    The directories are renamed straight away, so that new results can be written,
+    and the renamed directories are deleted in a background thread. Renamed directories
+    that are left over from an interrupted run are deleted too.
+
+    :returns: The thread that deletes the old directories, join it before exiting.
+    """
+    old_dirs = []
     for dir in dir_T_reX:
+        old_dirs += dir.parent.glob(f"{dir.name}.old.*")
         if os.path.exists(dir):
-            shutil.rmtree(dir)
+            old_dir = dir.with_name(f"{dir.name}.old.{os.getpid()}")
+            try:
+                os.rename(dir, old_dir)
+                old_dirs.append(old_dir)
+            except OSError:
+                # e.g. on Windows, a directory with an open file can not be renamed
+                shutil.rmtree(dir, ignore_errors=True)
+
+    def delete_old_dirs():
+        for old_dir in old_dirs:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    thread = threading.Thread(target=delete_old_dirs)
+    thread.start()
+
+    return thread
 
 
 # FIN #
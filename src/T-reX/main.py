@@ -25,11 +25,15 @@ Arguments can be provided to change project/database names or to delete the proj
 #  0. Imports and configuration
 
 # Import standard modules
+import hashlib
+import logging
 import os
 import sys
 from time import sleep
 from datetime import datetime
-from multiprocessing import Pool, cpu_count
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import cpu_count, get_all_start_methods, get_context
 from pathlib import Path
 import bw2data as bd
 
@@ -37,7 +41,6 @@ import bw2data as bd
 # not necessary (but fun), so in a try/except block
 try:
     import cowsay
-    import logging
 
     logging.getLogger("playsound").setLevel(logging.ERROR)
     from playsound import playsound
@@ -51,6 +54,11 @@ num_cpus = int(
     )
 )
 
+# The workers of the database pools are not forked from the main process, see worker_options()
+mp_context = get_context(
+    "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+)
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, script_dir)
 # # Set the working directory to the location of this script
@@ -64,8 +72,12 @@ sys.path.insert(0, script_dir)
 
 # import custom modules (from root dir)
 from ExchangeEditor import ExchangeEditor
-from ExplodeDatabase import ExplodeDatabase
-from FutureScenarios import MakeFutureScenarios
+from ExplodeDatabase import (
+    EXPLODED_SUFFIXES,
+    ExplodeDatabase,
+    exploded_path,
+    load_exploded,
+)
 from MakeCustomDatabase import dbExcel2BW, dbWriteExcel
 from MethodEditor import AddMethods
 from SearchMaterial import SearchMaterial
@@ -73,13 +85,18 @@ from SearchWaste import SearchWaste
 from VerifyDatabase import VerifyDatabase
 
 # import configuration from config/user_settings.py
+from config.queries_materials import queries_materials
+from config.queries_waste import queries_waste
 from config.user_settings import (
     custom_bw2_dir,
     db_T_reX_name,
+    delete_T_reX_data,
     delete_T_reX_project,
     dir_logs,
     dir_tmp,
     dir_config,
+    dir_searchmaterial_results,
+    dir_searchwaste_results,
     generate_args_list,
     project_base,
     project_premise,
@@ -140,8 +157,15 @@ def run():
         pass
     
     
+    # delete old results and logs, in the background
+    if delete_T_reX_project:
+        delete_thread = delete_T_reX_data()
+
     # create future scenario databases
     if use_premise:
+        # imported here, so premise is not imported by the workers (or when it is not used)
+        from FutureScenarios import MakeFutureScenarios
+
         MakeFutureScenarios()
 
     assert use_T_reX, "use_T_reX is False, so T-reX will not run"
@@ -149,72 +173,40 @@ def run():
     start_time = datetime.now()
     args_list = generate_args_list(single_database=single_database)
     total_databases = len(args_list)
-    all_databases = list(set(bd.databases) - {"biosphere3"})
+    # only the number of databases is needed, so they are counted without building a list
+    all_db_count = sum(1 for db_name in bd.databases if db_name != "biosphere3")
 
     print(
-        f"\nStarting T-reX for {total_databases}/{len(all_databases)} databases in project {project_base}\n{'-'*50}"
+        f"\nStarting T-reX for {total_databases}/{all_db_count} databases in project {project_base}\n{'-'*50}"
     )
     for arg in args_list:
         print(f"\t{arg['db_name']}")
 
     # Make new project, delete previous project if you want to start over, or use existing project
-    bd.projects.purge_deleted_directories()
-    if project_T_reX in bd.projects and delete_T_reX_project:
-        print(f"\n* Deleting previous project {project_T_reX}")
-        bd.projects.delete_project(project_T_reX, True)
-        bd.projects.purge_deleted_directories()
-
-    if project_T_reX in bd.projects:
-        print(f"* WasteAndMaterial project already exists: {project_T_reX}")
-        bd.projects.set_current(project_T_reX)
+    ensure_project(project_base, project_T_reX, delete=delete_T_reX_project)
 
-    if project_T_reX not in bd.projects:
-        print(
-            f"\n* Project {project_base} will be copied to a new project: {project_T_reX}"
-        )
-        bd.projects.set_current(project_base)
-        bd.projects.copy_project(project_T_reX)
-        bd.projects.set_current(project_T_reX)
+    # there is one task per database, so no more workers are started than there are databases,
+    # and a single database is processed in this process, without starting a pool
+    max_workers = max(1, min(num_cpus, total_databases))
+    use_pool = use_multiprocessing and total_databases > 1
 
     # 1.1 Run the initial steps for each database in the project
-    def process_db_setup(args, db_number, total_databases):
-        """
-        Process initial setup for a given database within the project.
-
-        This function is responsible for setting up each database by running the ExplodeAndSearch process.
-        It handles any exceptions during the process and logs errors.
-
-        :param dict args: Arguments containing database and project settings.
-        :param int db_number: The current database number in the processing sequence.
-        :param int total_databases: Total number of databases to be processed.
-        :return: int: Returns 1 if successful, 0 if an error occurred.
-        """
-        print(f'\n{"-"*80}')
-        try:
-            print(
-                f"\n** Pre-processing database ({db_number+1}/{total_databases}): {args['db_name']}**\n"
-            )
-            print(args)
-            if do_search:
-                ExplodeAndSearch(args)
-            print(f'\n{"-"*80}')
-            return 1  # successfully processed
-        except Exception as e:
-            print(
-                f"\n{'@'*50}\n\tError pre-processing database {args['db_name']}! \n\n\t{e}\n{'@'*50}\n"
-            )
-            print(f'\n{"-"*80}')
-            return 0  # error occurred
-
     results = []
-    if use_multiprocessing:
-        with Pool(processes=num_cpus) as pool:
-            for db_number, arg in enumerate(args_list):
-                pool.apply_async(
-                    process_db_setup,
-                    (arg, db_number, total_databases),
-                    callback=results.append,
-                )
+    if use_pool:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(custom_bw2_dir, project_T_reX),
+            **worker_options(),
+        ) as executor:
+            futures = [
+                executor.submit(process_db_setup, arg, db_number, total_databases)
+                for db_number, arg in enumerate(args_list)
+            ]
+            # the results are collected as the databases finish, not in the order they were submitted
+            for future in as_completed(futures):
+                results.append(future.result())
+                print(f"\n* Pre-processed {len(results)}/{total_databases} databases")
 
     else:
         for db_number, arg in enumerate(args_list):
@@ -228,8 +220,8 @@ def run():
 
     if do_methods:
         #  1.2 MakeCustomDatabase.py: Make the custom database from the combined search results
-        dbWriteExcel()
-        dbExcel2BW()
+        xl_filename = dbWriteExcel()
+        dbExcel2BW(xl_filename)
         #  1.3 MethodEditor.py: adds LCIA methods to the project for each of the waste/material flows
         AddMethods()
 
@@ -246,63 +238,48 @@ def run():
     """
     )
 
-    def process_db(args, db_number, total_databases):
-        """
-        Process the database by editing exchanges
-
-        :param dict args: Arguments containing database and project settings.
-        :param int db_number: The current database number in the processing sequence.
-        :param int total_databases: Total number of databases to be processed.
-
-        :return: int: Returns 1 if successful, 0 if an error occurred.
-        """
-        print(f'\n{"-"*80}')
-        try:
-            print(
-                f"\n** Processing database ({db_number}/{total_databases}): {args['db_name']}**"
-            )
-            print("Arguments:")
-            print(args)
-            if do_edit:
-                EditExchanges(args)
-            print(f'{"-"*80}\n')
-            return 1  # successfully processed
-        except Exception as e:
-            print(
-                f"\n{'@'*50}\n\tError processing database {args['db_name']}! \n\n\t{e}\n{'@'*50}\n"
-            )
-            print(f'{"-"*80}\n')
-            return 0  # error occurred
+    # the workers send the records of the main log to a single writer
+    os.makedirs(dir_logs, exist_ok=True)
+    log_handler = logging.FileHandler(dir_logs / "main_log.txt")
+    log_handler.setFormatter(
+        logging.Formatter("%(asctime)s\t %(message)s", datefmt="%Y-%m-%d")
+    )
+    log_queue = mp_context.Queue()
+    log_listener = QueueListener(log_queue, log_handler)
+    log_listener.start()
+    init_main_log(log_queue)
 
     results = []
-    db_number = 0
-    if use_multiprocessing:
-        with Pool(processes=num_cpus) as pool:
-            for arg in args_list:
-                pool.apply_async(
-                    process_db,
-                    (arg, db_number, total_databases),
-                    callback=results.append,
-                )
+    if use_pool:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(custom_bw2_dir, project_T_reX, log_queue),
+            **worker_options(),
+        ) as executor:
+            futures = [
+                executor.submit(process_db, arg, db_number, total_databases)
+                for db_number, arg in enumerate(args_list, start=1)
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+                print(f"\n* Processed {len(results)}/{total_databases} databases")
 
     else:
-        for args in args_list:
-            db_number += 1
-            result = process_db(args, db_number, total_databases)
+        for db_number, arg in enumerate(args_list, start=1):
+            result = process_db(arg, db_number, total_databases)
             results.append(result)
 
+    log_listener.stop()
+    log_handler.close()
+
     successful_count = sum(results)
 
     end_time = datetime.now()
     duration = end_time - start_time
 
-    # 1.4 VerifyDatabase.py: Verify the database
-    print(f'\n{"-"*80}')
-    print("\t*** Verifying all databases in the project **")
-    for arg in args_list:
-        db_name = arg["db_name"]
-        VerifyDatabase(project_T_reX, db_name)
-        print(f'\n{"-"*80}\n')
+    if delete_T_reX_project:
+        delete_thread.join()
 
     try:
         playsound(script_dir.parents[1] / "misc/success.mp3")
@@ -347,6 +324,144 @@ def run():
     print(f'\n{"="*80}\n')
 
 
+def ensure_project(project_base, project_T_reX, delete=False):
+    """
+    Make the T-reX project the current project, copying it from the base project if it does not exist yet.
+
+    :param str project_base: The Brightway2 project to copy.
+    :param str project_T_reX: The Brightway2 project that T-reX works in.
+    :param bool delete: If True, delete the existing T-reX project first, to start over.
+    :returns: None
+    """
+    bd.projects.purge_deleted_directories()
+    if delete and project_T_reX in bd.projects:
+        print(f"\n* Deleting previous project {project_T_reX}")
+        bd.projects.delete_project(project_T_reX, True)
+        bd.projects.purge_deleted_directories()
+
+    elif project_T_reX in bd.projects:
+        print(f"* WasteAndMaterial project already exists: {project_T_reX}")
+        bd.projects.set_current(project_T_reX)
+        return None
+
+    print(
+        f"\n* Project {project_base} will be copied to a new project: {project_T_reX}"
+    )
+    bd.projects.set_current(project_base)
+    # copy_project also makes the copy the current project
+    bd.projects.copy_project(project_T_reX)
+
+    return None
+
+
+def worker_options():
+    """
+    Options for the database pools that give each database a fresh worker process.
+
+    Brightway2 and wurst do not give all their memory back after a database is processed,
+    so a worker is replaced after each task (from Python 3.11). The workers are started
+    from `mp_context`, objects that are shared with them must be made from it too.
+
+    :returns: dict of keyword arguments for ProcessPoolExecutor.
+    """
+    if sys.version_info < (3, 11):
+        return {"mp_context": mp_context}
+    return {"max_tasks_per_child": 1, "mp_context": mp_context}
+
+
+def init_worker(bw2_dir, project_name, log_queue=None):
+    """
+    Prepare a worker process of the database pools, once per worker instead of once per database.
+
+    Sets the Brightway2 data directory, imports bw2data and sets the current project.
+
+    :param str bw2_dir: Custom Brightway2 data directory (or None to use the default).
+    :param str project_name: The Brightway2 project that the workers use.
+    :param Queue log_queue: Queue that the main log records are sent to (or None to not log).
+    :returns: None
+    """
+    if bw2_dir:
+        os.environ["BRIGHTWAY2_DIR"] = bw2_dir
+    import bw2data as bd
+
+    bd.projects.set_current(project_name)
+    if log_queue is not None:
+        init_main_log(log_queue)
+
+
+def init_main_log(log_queue):
+    """
+    Send the records of the main log to a queue, where a single listener writes them to main_log.txt.
+
+    :param Queue log_queue: Queue that the log records are sent to.
+    :returns: None
+    """
+    logger = logging.getLogger("T-reX")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    # replace the handler (not add to it), so the records are not sent twice if this is called again
+    logger.handlers = [QueueHandler(log_queue)]
+
+
+def process_db_setup(args, db_number, total_databases):
+    """
+    Process initial setup for a given database within the project.
+
+    This function is responsible for setting up each database by running the ExplodeAndSearch process.
+    It handles any exceptions during the process and logs errors.
+
+    :param dict args: Arguments containing database and project settings.
+    :param int db_number: The current database number in the processing sequence.
+    :param int total_databases: Total number of databases to be processed.
+    :return: int: Returns 1 if successful, 0 if an error occurred.
+    """
+    print(f'\n{"-"*80}')
+    try:
+        print(
+            f"\n** Pre-processing database ({db_number+1}/{total_databases}): {args['db_name']}**\n"
+        )
+        print(args)
+        if do_search:
+            ExplodeAndSearch(args)
+        print(f'\n{"-"*80}')
+        return 1  # successfully processed
+    except Exception as e:
+        print(
+            f"\n{'@'*50}\n\tError pre-processing database {args['db_name']}! \n\n\t{e}\n{'@'*50}\n"
+        )
+        print(f'\n{"-"*80}')
+        return 0  # error occurred
+
+
+def process_db(args, db_number, total_databases):
+    """
+    Process the database by editing exchanges
+
+    :param dict args: Arguments containing database and project settings.
+    :param int db_number: The current database number in the processing sequence.
+    :param int total_databases: Total number of databases to be processed.
+
+    :return: int: Returns 1 if successful, 0 if an error occurred.
+    """
+    print(f'\n{"-"*80}')
+    try:
+        print(
+            f"\n** Processing database ({db_number}/{total_databases}): {args['db_name']}**"
+        )
+        print("Arguments:")
+        print(args)
+        if do_edit:
+            EditExchanges(args)
+        print(f'{"-"*80}\n')
+        return 1  # successfully processed
+    except Exception as e:
+        print(
+            f"\n{'@'*50}\n\tError processing database {args['db_name']}! \n\n\t{e}\n{'@'*50}\n"
+        )
+        print(f'{"-"*80}\n')
+        return 0  # error occurred
+
+
 def ExplodeAndSearch(args):
     """
     Exploding the database into separate exchanges, searching for waste and
@@ -367,17 +482,100 @@ def ExplodeAndSearch(args):
     print(f"\n{'='*100}\n\t Starting T-reX for {db_name}\n{'='*100}")
 
     # 1.2 Explode the database into separate exchanges
-    existing_file = dir_tmp / (db_name + "_exploded.pickle")
-    if os.path.isfile(existing_file):
+    explode_if_stale(db_name)
+
+    # Skip the searches if their results are saved for the same queries and exploded database
+    key_file = dir_tmp / f"{db_name}_search.key"
+    key = search_key(db_name)
+    if (
+        key_file.is_file()
+        and key_file.read_text() == key
+        and (dir_searchwaste_results / db_name).is_dir()
+        and (dir_searchmaterial_results / db_name).is_dir()
+    ):
+        print(
+            "\n* Existing search results found, they will be reused for the current run"
+        )
+        return None
+
+    # the key is written again when both searches have finished, so an interrupted
+    # run does not leave a key next to incomplete results
+    key_file.unlink(missing_ok=True)
+
+    # 1.3 Search the exploded database for waste and material flows,
+    # the searches do not depend on each other, so they run at the same time.
+    # The exploded database is loaded once, before, so both searches use the same cached DataFrame
+    load_exploded(db_name)
+    # SearchWaste stays on this thread: when numba uses the TBB threading layer,
+    # the process hangs at exit if a parallel kernel was first run from another thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # the messages of SearchMaterial are returned, and printed after the output of SearchWaste
+        material_search = executor.submit(
+            SearchMaterial, db_name, project_T_reX, quiet=True
+        )
+        SearchWaste(db_name)
+        # raise any error from SearchMaterial
+        print(material_search.result(), end="")
+
+    key_file.write_text(key)
+
+    return None
+
+
+def search_key(db_name):
+    """
+    Fingerprint of everything that the search results depend on: the waste and material
+    queries and the exploded database (which is newer than the Brightway2 database).
+
+    :param str db_name: Name of the Brightway2 database.
+    :returns: str sha256 hex digest.
+    """
+    existing_file = exploded_path(db_name)
+    inputs = repr(
+        (
+            queries_waste,
+            queries_materials,
+            str(existing_file),
+            os.path.getmtime(existing_file),
+        )
+    )
+    return hashlib.sha256(inputs.encode()).hexdigest()
+
+
+def bw_db_mtime(db_name):
+    """
+    Get the time when the Brightway2 database was last processed.
+
+    :param str db_name: Name of the Brightway2 database.
+    :returns: float modification time of the processed database, or infinity if it cannot be found,
+        so that an exploded database is never taken to be newer than an unknown one.
+    """
+    try:
+        return os.path.getmtime(bd.Database(db_name).filepath_processed())
+    except (AttributeError, OSError):
+        return float("inf")
+
+
+def explode_if_stale(db_name):
+    """
+    Explode the database, unless an exploded database is saved that is newer than
+    the Brightway2 database.
+
+    :param str db_name: Name of the Brightway2 database.
+    :returns: None
+    """
+    existing_file = exploded_path(db_name)
+    if (
+        existing_file is not None
+        and os.path.getmtime(existing_file) > bw_db_mtime(db_name)
+    ):
         print(f"\n* Existing exploded database found: {existing_file}")
         print("\n* Existing data will be reused for the current run")
     else:
+        if existing_file is not None:
+            print(f"\n* Existing exploded database is out of date: {existing_file}")
         ExplodeDatabase(db_name)
 
-    # 1.3 Search the exploded database for waste and material flows
-    SearchWaste(db_name)
-    SearchMaterial(db_name, project_T_reX)
-
     return None
 
 
@@ -413,15 +611,9 @@ def EditExchanges(args):
     print("\t*** Woah woah wee waa, great success!! ***")
     print(f"{'='*90}")
 
-    with open(f"{dir_logs / 'main_log.txt'}", "a") as log:
-        log.write(
-            datetime.now().strftime("%Y-%m-%d")
-            + "\t Duration:"
-            + str(duration).split(".")[0]
-            + " "
-            + db_name
-            + "\n"
-        )
+    logging.getLogger("T-reX").info(
+        "Duration:%s %s", str(duration).split(".")[0], db_name
+    )
 
     return None
 
@@ -429,6 +621,8 @@ def EditExchanges(args):
 if __name__ == "__main__":
     run()
     
-    # clean up tmp files
+    # clean up tmp files, but keep the exploded databases and the search keys,
+    # so the next run can reuse them (see explode_if_stale and ExplodeAndSearch)
     for file in dir_tmp.glob("*"):
-        os.remove(file)
+        if not file.name.endswith((*EXPLODED_SUFFIXES, "_search.key")):
+            os.remove(file)
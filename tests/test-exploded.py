@@ -0,0 +1,68 @@
+# Check that a parquet and a pickle exploded database give the same result CSVs
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src" / "T-reX"))
+
+import pandas as pd
+
+import config.user_settings
+from ExplodeDatabase import exploded_cache, load_exploded, read_csv, write_csv
+
+# a toy exploded database, with the nested values as they come from Brightway2
+df = pd.DataFrame(
+    {
+        "code": ["a", "a", "b"],
+        "name": ["waste treatment", "waste treatment", "market for steel"],
+        "categories": [("air", "urban"), ("air", "urban"), None],
+        "classifications": [
+            [("ISIC rev.4 ecoinvent", "3821:Treatment"), ("CPC", "39")],
+            [("ISIC rev.4 ecoinvent", "3821:Treatment"), ("CPC", "39")],
+            None,
+        ],
+        "ex_name": ["municipal solid waste", "electricity", "steel"],
+        "ex_amount": [-1.0, 2.5, 1.0],
+        "ex_unit": ["kilogram", "kilowatt hour", "kilogram"],
+        "ex_type": ["technosphere", "technosphere", "production"],
+    }
+).set_index("code")
+for column in ["ex_unit", "ex_type"]:
+    df[column] = df[column].astype("category")
+
+with tempfile.TemporaryDirectory() as tmp:
+    tmp = Path(tmp)
+    # exploded_path() looks for the files in dir_tmp
+    config.user_settings.dir_tmp = tmp
+    df.to_parquet(tmp / "db1_exploded.parquet", engine="pyarrow")
+    df.to_pickle(tmp / "db2_exploded.pickle")
+
+    texts = {}
+    for db_name in ["db1", "db2"]:
+        for filters in [None, [("ex_type", "==", "technosphere")]]:
+            exploded_cache.clear()
+            loaded = load_exploded(db_name, filters=filters)
+            csv_path = tmp / f"{db_name}_{filters is None}.csv"
+            write_csv(loaded, csv_path)
+            texts[db_name, filters is None] = csv_path.read_text()
+
+    for full in [True, False]:
+        assert texts["db1", full] == texts["db2", full], (
+            texts["db1", full],
+            texts["db2", full],
+        )
+    assert "('air', 'urban')" in texts["db1", True]
+    assert (
+        "[('ISIC rev.4 ecoinvent', '3821:Treatment'), ('CPC', '39')]"
+        in texts["db1", True]
+    )
+
+    # whole amounts are written without a decimal point, but are still read as floats
+    write_csv(df[df["ex_amount"] != 2.5], tmp / "whole.csv")
+    assert "-1.0" not in (tmp / "whole.csv").read_text()
+    amounts = read_csv(tmp / "whole.csv")["ex_amount"]
+    assert amounts.dtype == float, amounts.dtype
+    assert list(amounts) == [-1.0, 1.0]
+
+print(texts["db1", True])
+print("\nDone!")
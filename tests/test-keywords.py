@@ -0,0 +1,111 @@
+# Check that every keyword search backend of SearchWaste finds the same names
+# as the plain python filters: all(AND), any(OR) and not any(NOT)
+import sys
+from itertools import product
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src" / "T-reX"))
+
+import numpy as np
+import pandas as pd
+
+import SearchWaste
+from config.queries_waste import queries_waste
+from SearchWaste import build_keyword_index, keyword_mask, match_keywords
+
+names = pd.Series(
+    [
+        "municipal solid waste",
+        "hazardous waste, for incineration",
+        "non-hazardous waste, for landfill",
+        "waste wood, for recycling",
+        None,
+        "radioactive waste, for final repository",
+        "non-radioactive waste",
+        "carbon dioxide, captured",
+        "carbon dioxide storage, with methane leakage",
+        "",
+        "sludge, for composting",
+        np.nan,
+        "biowaste, for anaerobic digestion",
+        "residues, open burning",
+        "electricity, high voltage",
+        "municipal solid waste",
+    ],
+    name="ex_name",
+)
+
+# the queries of the tool, and some with empty keyword lists
+queries = [(q["AND"], q["OR"], q["NOT"]) for q in queries_waste] + [
+    (["waste"], [], []),
+    ([], ["sludge", "wood"], None),
+    ([""], None, ["waste"]),
+    ([], None, None),
+]
+
+
+def expected(name, AND, OR, NOT):
+    """The filters of the original search, a missing name never matches."""
+    if not isinstance(name, str):
+        return False
+    return (
+        all(k in name for k in AND)
+        and (not OR or any(k in name for k in OR))
+        and not any(k in name for k in NOT or [])
+    )
+
+
+def search(AND, OR, NOT):
+    """The rows found with the keyword bitsets, as SearchWaste does it."""
+    keywords = [k for AND, OR, NOT in queries for k in AND + (OR or []) + (NOT or [])]
+    vocab, codes, bits = build_keyword_index(names, keywords)
+    n_words = bits.shape[1]
+    hits = match_keywords(
+        bits,
+        keyword_mask(vocab, AND, n_words),
+        keyword_mask(vocab, OR, n_words),
+        keyword_mask(vocab, NOT, n_words),
+        np.ones(bits.shape[0], dtype=np.bool_),
+    )
+    return list((codes >= 0) & hits[codes])
+
+
+# the optional packages that choose the backends, None if not installed
+optional = {
+    "njit": SearchWaste.njit,
+    "pl": SearchWaste.pl,
+    "pc": SearchWaste.pc,
+    "ahocorasick": SearchWaste.ahocorasick,
+}
+# the bitsets are built by polars, pyarrow, pyahocorasick or generated code,
+# and matched by numba or numpy: (package that is used, packages that are turned off)
+index_backends = {
+    "polars": ("pl", []),
+    "pyarrow": ("pc", ["pl"]),
+    "ahocorasick": ("ahocorasick", ["pl", "pc"]),
+    "codegen": (None, ["pl", "pc", "ahocorasick"]),
+}
+match_backends = {
+    "numba": ("njit", []),
+    "numpy": (None, ["njit"]),
+}
+
+reference = [[expected(name, *query) for name in names] for query in queries]
+for (index, (index_used, index_off)), (match, (match_used, match_off)) in product(
+    index_backends.items(), match_backends.items()
+):
+    # skip the backends whose package is not installed
+    if any(optional[key] is None for key in [index_used, match_used] if key):
+        print(f"Skipping {index} + {match}, not installed")
+        continue
+
+    for key, value in optional.items():
+        setattr(SearchWaste, key, None if key in index_off + match_off else value)
+    for query, rows in zip(queries, reference):
+        assert search(*query) == rows, (index, match, query)
+    print(f"{index} + {match}: OK")
+
+for key, value in optional.items():
+    setattr(SearchWaste, key, value)
+
+print("\nDone!")